@@ -0,0 +1,58 @@
+"""
+This module loads the settings from config.ini once and exposes them as an immutable dataclass.
+"""
+
+import configparser
+import functools
+from dataclasses import dataclass
+
+CONFIG_PATH = 'config.ini'
+
+
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """
+    Settings read from the [Settings] section of the config file.
+    """
+    openai_model: str
+    metadata_path: str
+    temperature: float
+    embed_model: str
+    index_dir: str
+    data_dir: str
+    k: int
+    rerank_model: str
+    similarity_top_k: int
+    rerank_top_n: int
+    cache_similarity_threshold: float
+    response_cache_path: str
+
+
+@functools.lru_cache(maxsize=1)
+def load_config(config_path: str = CONFIG_PATH) -> Settings:
+    """
+    Parses the config file into a Settings instance; later calls return the cached instance.
+
+    Args:
+        config_path: Path to the config file.
+
+    Returns:
+        The parsed settings.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    settings = config['Settings']
+    return Settings(
+        openai_model=settings['OPENAI_MODEL'],
+        metadata_path=settings['METADATA_PATH'],
+        temperature=settings.getfloat('TEMPERATURE'),
+        embed_model=settings['EMBED_MODEL'],
+        index_dir=settings['INDEX_DIR'],
+        data_dir=settings['DATA_DIR'],
+        k=settings.getint('K'),
+        rerank_model=settings['RERANK_MODEL'],
+        similarity_top_k=settings.getint('SIMILARITY_TOP_K'),
+        rerank_top_n=settings.getint('RERANK_TOP_N'),
+        cache_similarity_threshold=settings.getfloat('CACHE_SIMILARITY_THRESHOLD'),
+        response_cache_path=settings['RESPONSE_CACHE_PATH'],
+    )
@@ -0,0 +1,85 @@
+"""
+This module defines an embedding model wrapper that caches text embeddings on disk.
+Embeddings are keyed by a hash of the model name and the text, so re-indexing only embeds changed chunks.
+"""
+
+import hashlib
+import sqlite3
+from typing import Any, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    An embedding model that looks up text embeddings in a SQLite cache before calling the wrapped model.
+    """
+
+    inner: BaseEmbedding = Field(description="The embedding model used for texts missing from the cache.")
+    cache_path: str = Field(description="Path of the SQLite file the embeddings are stored in.")
+
+    _conn: sqlite3.Connection = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache_path: str = "embed_cache.sqlite", **kwargs: Any):
+        """
+        Initializes the cache and wraps the given embedding model.
+
+        :param inner: The embedding model used for texts missing from the cache.
+        :param cache_path: Path of the SQLite file the embeddings are stored in.
+        """
+        kwargs.setdefault("embed_batch_size", inner.embed_batch_size)
+        super().__init__(inner=inner, cache_path=cache_path, model_name=inner.model_name, **kwargs)
+        self._conn = sqlite3.connect(cache_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def _cache_key(self, text: str) -> bytes:
+        """
+        Computes the cache key of a text for the wrapped model.
+
+        :param text: The text to embed.
+        :return: The SHA-256 digest of the model name and the text.
+        """
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).digest()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        """
+        Embeds a batch of texts, sending only the texts missing from the cache to the wrapped model.
+
+        :param texts: The texts to embed.
+        :return: Embeddings of the texts.
+        """
+        keys = [self._cache_key(text) for text in texts]
+        placeholders = ",".join("?" * len(keys))
+        cached = dict(self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys))
+
+        misses = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if misses:
+            vectors = self.inner.get_text_embedding_batch(list(misses.values()))
+            new_rows = {key: np.asarray(vector, dtype=np.float16).tobytes() for key, vector in zip(misses, vectors)}
+            with self._conn:
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", new_rows.items())
+            cached.update(new_rows)
+
+        # Hits and misses are both returned from their stored fp16 form so results do not depend on cache state
+        return [np.frombuffer(cached[key], dtype=np.float16).astype(np.float32).tolist() for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embedding(text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._get_text_embeddings(texts)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.inner.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self.inner.aget_query_embedding(query)
@@ -3,9 +3,12 @@ This script reads the GDPR pdf and splits it into separate txt files for each Ar
 """
 
 import fitz  # PyMuPDF
+import os
 import re
 
 pdf_path = "data/GDPR Art 1-21.pdf"
+articles_dir = "data/articles"
+article_pattern = re.compile(r'EN\nArticle (\d+)\.')
 
 def save_article(article_number: str, article_text: str) -> str:
     """
@@ -18,8 +21,8 @@ def save_article(article_number: str, article_text: str) -> str:
     Returns:
         The filename where the article text was saved.
     """
-    filename = f"data/articles/Article {article_number}.txt"
-    with open(filename, 'w') as file:
+    filename = f"{articles_dir}/Article {article_number}.txt"
+    with open(filename, 'w', encoding='utf-8') as file:
         file.write(article_text)
     return filename
 
@@ -34,30 +37,30 @@ def split_gdpr_articles(pdf_path: str) -> list:
         A list of filenames for the saved article text files.
     """
     doc = fitz.open(pdf_path)
-    article_pattern = re.compile(r'EN\nArticle \d+\.')
+    os.makedirs(articles_dir, exist_ok=True)
 
-    current_article = None
+    # Page texts of the current article, joined once the article ends
+    current_chunks = None
     current_article_number = None
     saved_files = []
 
-    for page_num in range(len(doc)):
-        page = doc.load_page(page_num)
+    for page in doc:
         text = page.get_text()
 
-        for match in re.finditer(article_pattern, text):
-            if current_article is not None:
-                filename = save_article(current_article_number, current_article)
+        for match in article_pattern.finditer(text):
+            if current_chunks is not None:
+                filename = save_article(current_article_number, "".join(current_chunks))
                 saved_files.append(filename)
 
             # Prepare for the next article
-            current_article = ""
-            current_article_number = text[match.start():match.end()].split()[2].replace('.', '')
+            current_chunks = []
+            current_article_number = match.group(1)
 
-        if current_article is not None:
-            current_article += text
+        if current_chunks is not None:
+            current_chunks.append(text)
 
-    if current_article is not None:
-        filename = save_article(current_article_number, current_article)
+    if current_chunks is not None:
+        filename = save_article(current_article_number, "".join(current_chunks))
         saved_files.append(filename)
 
     return saved_files
@@ -0,0 +1,46 @@
+"""
+This module parses documents into hierarchical nodes, across worker processes for large document sets.
+It only imports the LlamaIndex node parser, so worker processes start without loading the heavier modules.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Dict, List
+
+from llama_index.core.node_parser import HierarchicalNodeParser
+
+# Below this many documents per worker, process start-up costs more than the parsing it parallelizes
+MIN_DOCUMENTS_PER_WORKER = 100
+
+
+def _parse_documents_shard(documents: List[Dict], chunk_sizes: List[int]) -> list:
+    """
+    Parses a shard of documents into hierarchical nodes; runs inside a worker process.
+    """
+    node_parser = HierarchicalNodeParser.from_defaults(chunk_sizes=chunk_sizes)
+    return node_parser.get_nodes_from_documents(documents)
+
+
+def parse_documents_parallel(documents: List[Dict], chunk_sizes: List[int], max_workers: int = None) -> list:
+    """
+    Parses documents into hierarchical nodes, splitting large document sets across worker processes.
+
+    Parameters:
+        documents: A list of document dictionaries to parse.
+        chunk_sizes: A list defining chunk sizes for hierarchical parsing.
+        max_workers: The maximum number of worker processes, defaults to the number of CPUs.
+
+    Returns:
+        The parsed nodes, in document order.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(documents) // MIN_DOCUMENTS_PER_WORKER)
+    if max_workers <= 1:
+        return _parse_documents_shard(documents, chunk_sizes)
+
+    # Contiguous shards keep the nodes in document order once chained back together
+    shard_size = -(-len(documents) // max_workers)
+    shards = [documents[i:i + shard_size] for i in range(0, len(documents), shard_size)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_parse_documents_shard, shards, [chunk_sizes] * len(shards))
+        return list(chain.from_iterable(results))
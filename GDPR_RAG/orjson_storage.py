@@ -0,0 +1,100 @@
+"""
+This module defines LlamaIndex storage classes that persist and load the index with orjson instead of the stdlib json.
+The files written keep the default LlamaIndex layout and format, so either loader can read them.
+"""
+
+import os
+from typing import Optional
+
+import fsspec
+import orjson
+from llama_index.core import StorageContext
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.core.storage.kvstore.simple_kvstore import SimpleKVStore
+from llama_index.core.vector_stores.simple import SimpleVectorStore, SimpleVectorStoreData
+
+DOCSTORE_FILE = "docstore.json"
+INDEX_STORE_FILE = "index_store.json"
+VECTOR_STORE_FILE = "default__vector_store.json"
+IMAGE_STORE_FILE = "image__vector_store.json"
+
+
+def _write_json(data: dict, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None):
+    """
+    Serializes a dictionary with orjson and writes it to the given path.
+
+    :param data: The dictionary to write.
+    :param persist_path: The file to write to.
+    :param fs: The filesystem to write with, defaults to the local filesystem.
+    """
+    fs = fs or fsspec.filesystem("file")
+    dirpath = os.path.dirname(persist_path)
+    if not fs.exists(dirpath):
+        fs.makedirs(dirpath)
+    with fs.open(persist_path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY))
+
+
+def _read_json(persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> dict:
+    """
+    Reads a JSON file and parses it with orjson.
+
+    :param persist_path: The file to read.
+    :param fs: The filesystem to read with, defaults to the local filesystem.
+    :return: The parsed dictionary.
+    """
+    fs = fs or fsspec.filesystem("file")
+    with fs.open(persist_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+class OrjsonKVStore(SimpleKVStore):
+    """
+    An in-memory key-value store that persists to JSON through orjson.
+    """
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        _write_json(self._data, persist_path, fs=fs)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> "OrjsonKVStore":
+        return cls(_read_json(persist_path, fs=fs))
+
+
+class OrjsonVectorStore(SimpleVectorStore):
+    """
+    An in-memory vector store that persists to JSON through orjson.
+    """
+
+    def persist(self, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> None:
+        _write_json(self._data.to_dict(), persist_path, fs=fs)
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str, fs: Optional[fsspec.AbstractFileSystem] = None) -> "OrjsonVectorStore":
+        return cls(SimpleVectorStoreData.from_dict(_read_json(persist_path, fs=fs)))
+
+
+def orjson_storage_context(persist_dir: Optional[str] = None) -> StorageContext:
+    """
+    Creates a storage context whose docstore, index store and vector stores use orjson for persistence.
+
+    :param persist_dir: Directory to load a persisted index from; an empty storage context is created if None.
+    :return: The storage context.
+    """
+    if persist_dir is None:
+        return StorageContext.from_defaults(
+            docstore=SimpleDocumentStore(OrjsonKVStore()),
+            index_store=SimpleIndexStore(OrjsonKVStore()),
+            vector_store=OrjsonVectorStore(),
+            image_store=OrjsonVectorStore(),
+        )
+
+    image_store_path = os.path.join(persist_dir, IMAGE_STORE_FILE)
+    return StorageContext.from_defaults(
+        docstore=SimpleDocumentStore(OrjsonKVStore.from_persist_path(os.path.join(persist_dir, DOCSTORE_FILE))),
+        index_store=SimpleIndexStore(OrjsonKVStore.from_persist_path(os.path.join(persist_dir, INDEX_STORE_FILE))),
+        vector_store=OrjsonVectorStore.from_persist_path(os.path.join(persist_dir, VECTOR_STORE_FILE)),
+        image_store=OrjsonVectorStore.from_persist_path(image_store_path) if os.path.exists(image_store_path) else OrjsonVectorStore(),
+        persist_dir=persist_dir,
+    )
@@ -5,11 +5,16 @@ relevant articles, retrieves the appropirate chunks from filtered articles and s
 
 
 import os
+import shelve
+import dataclasses
 import warnings
+from typing import List, Optional, Tuple
+import numpy as np
 from summary_matcher import SummaryMatcher
 from llama_index.llms.openai import OpenAI
-from utils import get_automerging_query_engine, load_automerging_index, get_prebuilt_trulens_recorder
-import configparser
+from utils import get_automerging_query_engine, load_automerging_index, get_prebuilt_trulens_recorder, get_rerank_model, \
+    load_article_summaries, load_article_index
+from config import load_config
 from trulens_eval import Tru
 
 tru = Tru()
@@ -17,86 +22,180 @@ tru.reset_database()
 
 warnings.filterwarnings("ignore")
 
-# Load settings from config file
-config = configparser.ConfigParser()
-config.read('config.ini')
+# Settings parsed once from the config file
+CFG = load_config()
 
-# Global settings from config file
-K = config.getint('Settings', 'K')
-OPENAI_MODEL = config['Settings']['OPENAI_MODEL']
-METADATA_PATH = config['Settings']['METADATA_PATH']
-TEMPERATURE = config.getfloat('Settings', 'TEMPERATURE')
-EMBED_MODEL = config['Settings']['EMBED_MODEL']
-INDEX_DIR = config['Settings']['INDEX_DIR']
+# Maximum number of responses kept in the semantic response cache, oldest ones are evicted first
+RESPONSE_CACHE_SIZE = 256
 
 # Ensures the OpenAI API key is set in the environment variables.
 if "OPENAI_API_KEY" not in os.environ:
     os.environ["OPENAI_API_KEY"] = input("\n\nPlease enter your OpenAI API Key: ")
 
-def load_article_summaries(meta_file_path: str) -> dict:
+
+class SemanticResponseCache:
+    """
+    Caches LLM responses keyed by query embedding, so that semantically equivalent queries reuse a response.
     """
-    Load article summaries from the specified metadata text file.
+
+    def __init__(self, header: dict, cache_path: str = CFG.response_cache_path,
+                 threshold: float = CFG.cache_similarity_threshold, max_size: int = RESPONSE_CACHE_SIZE):
+        """
+        Initializes the cache and loads the responses persisted by previous sessions with the same header.
+
+        Args:
+            header: Describes what the responses depend on (LLM, index, query embeddings); a persisted
+                cache with a different header is discarded.
+            cache_path: Path of the shelve file the cache is persisted to.
+            threshold: Minimum cosine similarity for a cached response to be returned.
+            max_size: Maximum number of cached responses.
+        """
+        self.header = header
+        self.max_size = max_size
+        self.cache_path = cache_path
+        self.threshold = threshold
+        self.embeddings = None
+        self.entries = []
+        with shelve.open(cache_path) as db:
+            if db.get('header') == header:
+                self.embeddings = db.get('embeddings')
+                self.entries = db.get('entries', [])
+
+    def lookup(self, query_embedding: np.ndarray) -> Optional[Tuple[str, List]]:
+        """
+        Returns the cached response of the most similar previous query, if it is similar enough.
+
+        Args:
+            query_embedding: L2-normalized embedding of the query.
+
+        Returns:
+            A tuple of the response text and its source nodes, or None on a cache miss.
+        """
+        if self.embeddings is None:
+            return None
+        sims = self.embeddings @ query_embedding
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            return self.entries[best]
+        return None
+
+    def add(self, query_embedding: np.ndarray, response: str, source_nodes: List):
+        """
+        Adds a response to the cache.
+
+        Args:
+            query_embedding: L2-normalized embedding of the query.
+            response: The response text.
+            source_nodes: The source nodes the response was synthesized from.
+        """
+        if self.embeddings is None:
+            self.embeddings = query_embedding[np.newaxis, :]
+        else:
+            self.embeddings = np.vstack([self.embeddings, query_embedding])
+        self.entries.append((response, source_nodes))
+        if len(self.entries) > self.max_size:
+            self.embeddings = self.embeddings[-self.max_size:]
+            self.entries = self.entries[-self.max_size:]
+
+    def save(self):
+        """Persists the cached responses to the shelve file."""
+        with shelve.open(self.cache_path) as db:
+            db['header'] = self.header
+            db['embeddings'] = self.embeddings
+            db['entries'] = self.entries
+
+
+def response_cache_header(matcher: SummaryMatcher) -> dict:
+    """
+    Builds the header identifying the settings, index and query embeddings cached responses were produced with.
 
     Args:
-        meta_file_path: Path to the metadata file containing article summaries.
+        matcher: The summary matcher whose query embeddings key the cache.
 
     Returns:
-        A dictionary mapping article keys to their summaries.
+        A dictionary describing the response cache's dependencies.
     """
-    article_summaries = {}
-    with open(meta_file_path, 'r') as file:
-        for line in file:
-            if line.strip():  # Check for non-empty lines
-                key, value = line.strip().split(':', 1)
-                # Extract the key after '**' and assign its value
-                article_summaries[key.split('**', 2)[1]] = value
-    return article_summaries
+    docstore_path = os.path.join(CFG.index_dir, 'docstore.json')
+    # Every setting except the response cache's own ones can change the answer
+    settings = dataclasses.asdict(CFG)
+    del settings['cache_similarity_threshold'], settings['response_cache_path']
+    return {
+        'settings': settings,
+        # Changes whenever the index is rebuilt
+        'index_mtime': os.stat(docstore_path).st_mtime_ns if os.path.exists(docstore_path) else None,
+        'query_embeddings': matcher.query_cache_header(),
+    }
+
+
+def print_response(response: str, source_nodes: List):
+    """Prints the source article and the response text."""
+    print("\n"+"#"*100)
+    print('\nSource Article:::')
+    print('Title:', source_nodes[0].metadata['article_number'])
+    print('Summary:', source_nodes[0].metadata['article_summary'])
+
+    print("\n"+"#"*100)
+    print("\nResponse:", response)
 
 
 def main():
     """Main function to process user queries and display similar articles."""
     # Load article summaries from a file.
-    article_summaries = load_article_summaries(METADATA_PATH)
+    article_summaries = load_article_summaries(CFG.metadata_path)
     
     # Initialize the summary matcher with the loaded summaries.
-    matcher = SummaryMatcher(k=K, summaries_dict=article_summaries)
+    matcher = SummaryMatcher(k=CFG.k, summaries_dict=article_summaries)
+    response_cache = SemanticResponseCache(response_cache_header(matcher))
+
+    # Load the LLM, automerging index and reranker once; they do not depend on the query.
+    llm = OpenAI(model=CFG.openai_model, temperature=CFG.temperature)
+    automerging_index = load_automerging_index(llm=llm, embed_model=CFG.embed_model, save_dir=CFG.index_dir)
+    article_to_node_ids = load_article_index(automerging_index, save_dir=CFG.index_dir)
+    get_rerank_model()
 
     # Continuously process user queries until 'exit' is entered.
-    while True:
-        user_query = input("\n\nEnter your query (or type 'exit' to quit): ").lower()
-        if user_query == 'exit':
-            break
-
-        # Find top matching document names based on the user query.
-        top_doc_names = matcher.compute_similarity(user_query)
-        print("\nTop similar articles:")
-        for doc_name in top_doc_names:
-            print(doc_name)
-
-        # Load the automerging index and query engine for advanced processing.
-        llm = OpenAI(model=OPENAI_MODEL, temperature=TEMPERATURE)
-        automerging_index = load_automerging_index(llm=llm, embed_model=EMBED_MODEL, save_dir=INDEX_DIR)
-        automerging_query_engine = get_automerging_query_engine(automerging_index, top_doc_names)
-        
-        # Query the engine and display the response.
-        tru_recorder_automerging = get_prebuilt_trulens_recorder(automerging_query_engine,
-                                                                app_id="Automerging Query Engine")
-        with tru_recorder_automerging as recording:
-            auto_merging_response = automerging_query_engine.query(user_query)
-
-        print("\n"+"#"*100)
-        print('\nSource Article:::')
-        print('Title:', auto_merging_response.source_nodes[0].metadata['article_number'])
-        print('Summary:', auto_merging_response.source_nodes[0].metadata['article_summary'])
-
-        print("\n"+"#"*100)
-        print("\nResponse:", str(auto_merging_response))
+    # Caches are saved in finally so they survive Ctrl-C and end of input as well as exit.
+    try:
+        while True:
+            user_query = input("\n\nEnter your query (or type 'exit' to quit): ").lower()
+            if user_query == 'exit':
+                break
+
+            # Reuse the response of a semantically equivalent earlier query, skipping retrieval and the LLM call.
+            query_embedding = matcher.embed_query(user_query).astype(np.float32)
+            cached = response_cache.lookup(query_embedding)
+            if cached is not None:
+                print_response(*cached)
+                continue
+
+            # Find top matching document names based on the user query.
+            top_doc_names = matcher.compute_similarity(user_query)
+            print("\nTop similar articles:")
+            for doc_name in top_doc_names:
+                print(doc_name)
+
+            # Build the query engine restricted to the relevant articles.
+            automerging_query_engine = get_automerging_query_engine(automerging_index, top_doc_names,
+                                                                    article_to_node_ids=article_to_node_ids)
         
-        print("\n"+"#"*100)
-        rec = recording.get()
-        print("\nEvaluation:::")
-        for feedback, feedback_result in rec.wait_for_feedback_results().items():
-            print(feedback.name, feedback_result.result)
+            # Query the engine and display the response.
+            tru_recorder_automerging = get_prebuilt_trulens_recorder(automerging_query_engine,
+                                                                    app_id="Automerging Query Engine")
+            with tru_recorder_automerging as recording:
+                auto_merging_response = automerging_query_engine.query(user_query)
+
+            print_response(str(auto_merging_response), auto_merging_response.source_nodes)
+            response_cache.add(query_embedding, str(auto_merging_response), auto_merging_response.source_nodes)
+
+            print("\n"+"#"*100)
+            rec = recording.get()
+            print("\nEvaluation:::")
+            # TruLens already evaluates the feedbacks concurrently on its own thread pool
+            for feedback, feedback_result in rec.wait_for_feedback_results().items():
+                print(feedback.name, feedback_result.result)
+    finally:
+        matcher.save_query_cache()
+        response_cache.save()
 
 if __name__ == "__main__":
 
@@ -4,31 +4,105 @@ It utilizes the sentence transformer model to encode texts and compute similarit
 """
 
 from transformers import AutoTokenizer, AutoModel
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+import numpy as np
 import torch
+from collections import OrderedDict
 from typing import Dict, List, Tuple
+import pickle
 import os
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
+QUANTIZED_FILE_NAME = "model_quantized.onnx"
+QUERY_CACHE_PATH = os.path.expanduser("~/.cache/gdpr_rag/query_embeds.pkl")
+# Maximum number of query embeddings kept, least recently used ones are evicted first
+QUERY_CACHE_SIZE = 1024
+# Bumped whenever the way embeddings are computed changes, invalidating persisted query embeddings
+QUERY_CACHE_VERSION = 2
+# Token limit used when encoding summaries, and queries outside the CUDA graph path
+TEXT_MAX_LENGTH = 128
+# On CUDA, queries are padded to this fixed length so the captured CUDA graph can be replayed for any query
+QUERY_MAX_LENGTH = 32
+
+
+def get_device() -> str:
+    """
+    Returns the best available torch device.
+
+    :return: 'cuda' or 'mps' when available, otherwise 'cpu'.
+    """
+    if torch.cuda.is_available():
+        return 'cuda'
+    if torch.backends.mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+
+def export_quantized_onnx(model_name: str, save_dir: str) -> str:
+    """
+    Exports a transformer model to ONNX and applies dynamic INT8 quantization to it.
+
+    :param model_name: Name of the transformer model to export.
+    :param save_dir: Directory where the quantized ONNX model is saved.
+    :return: The directory containing the quantized model.
+    """
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    quantizer = ORTQuantizer.from_pretrained(ort_model)
+    qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=save_dir, quantization_config=qconfig)
+    return save_dir
+
 class SummaryMatcher:
     """
     A class for finding the top document names that match a query based on semantic similarity of their summaries.
     """
 
-    def __init__(self, k: int  = 5, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", summaries_dict: Dict[str, str] = None):
+    def __init__(self, k: int  = 5, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", summaries_dict: Dict[str, str] = None,
+                 use_onnx: bool = True, onnx_dir: str = "minilm_onnx_int8", query_cache_path: str = QUERY_CACHE_PATH):
         """
         Initializes the SummaryMatcher with a specific transformer model and preloads summaries.
 
         :param k: no of similar documents to be returned
         :param model_name: Name of the transformer model to use.
         :param summaries_dict: A dictionary mapping document names to their summaries.
+        :param use_onnx: Whether to run the model as an INT8 quantized ONNX Runtime model instead of PyTorch on CPU.
+        :param onnx_dir: Directory where the quantized ONNX model is exported to or loaded from.
+        :param query_cache_path: Pickle file used to persist query embeddings across sessions.
         """
         self.k = k
+        self.model_name = model_name
+        self.query_cache_path = query_cache_path
+        self.device = get_device()
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        
+        if use_onnx and self.device == 'cpu':
+            if not os.path.exists(os.path.join(onnx_dir, QUANTIZED_FILE_NAME)):
+                export_quantized_onnx(model_name, onnx_dir)
+            self.model = ORTModelForFeatureExtraction.from_pretrained(onnx_dir, file_name=QUANTIZED_FILE_NAME)
+            self.backend = 'onnx-int8'
+        else:
+            self.model = AutoModel.from_pretrained(model_name).to(self.device).eval()
+            if self.device != 'cpu':
+                self.model.half()
+            self.backend = f'torch-{self.device}'
+
+        # On CUDA, queries are tokenized to a fixed shape and copied into pinned buffers allocated once,
+        # then encoded by replaying a captured graph; other devices keep dynamic padding
+        self._query_graph = None
+        if self.device == 'cuda':
+            self._tok_kwargs = dict(padding='max_length', truncation=True, max_length=QUERY_MAX_LENGTH, return_tensors='pt',
+                                    return_token_type_ids=False)
+            # Only the inputs the captured graph reads get a buffer
+            self._query_bufs = {name: torch.zeros(1, QUERY_MAX_LENGTH, dtype=torch.long).pin_memory()
+                                for name in ('input_ids', 'attention_mask')}
+            self._capture_query_graph()
+        self._query_embeddings = self.load_query_cache()
+
         if summaries_dict is None:
             raise ValueError("summaries_dict is required and cannot be None")
-        self.doc_names, self.summaries, self.embeddings = self.load_and_encode_summaries(summaries_dict)
+        self.doc_names, self.summaries, embeddings = self.load_and_encode_summaries(summaries_dict)
+        # Normalize once so that cosine similarity reduces to a dot product; fp16 halves the memory traffic
+        self.embeddings_np = torch.nn.functional.normalize(embeddings, dim=1).to(torch.float16).cpu().numpy()
 
     def load_and_encode_summaries(self, summaries_dict: Dict[str, str]) -> Tuple[List[str], List[str], torch.Tensor]:
         """
@@ -39,10 +113,10 @@ class SummaryMatcher:
         """
         doc_names = list(summaries_dict.keys())
         summaries = list(summaries_dict.values())
-        with torch.no_grad():
-            embeddings = self.encode_texts(summaries)
+        embeddings = self.encode_texts(summaries)
         return doc_names, summaries, embeddings
 
+    @torch.inference_mode()
     def encode_texts(self, texts: List[str]) -> torch.Tensor:
         """
         Encodes a list of texts into embeddings.
@@ -50,9 +124,138 @@ class SummaryMatcher:
         :param texts: A list of texts to encode.
         :return: Embeddings of the texts.
         """
-        encoded_input = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt', max_length=128)
+        encoded_input = self.tokenizer(texts, padding=True, truncation=True, return_tensors='pt', max_length=TEXT_MAX_LENGTH)
+        encoded_input = {name: tensor.to(self.device) for name, tensor in encoded_input.items()}
         model_output = self.model(**encoded_input)
-        return model_output.last_hidden_state.mean(dim=1)
+        return self.mean_pool(model_output.last_hidden_state, encoded_input['attention_mask'])
+
+    @staticmethod
+    def mean_pool(hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """
+        Averages token embeddings over real tokens only, so padding does not dilute the embedding.
+
+        :param hidden_state: Token embeddings of shape (batch, tokens, dim).
+        :param attention_mask: Attention mask of shape (batch, tokens).
+        :return: Pooled embeddings of shape (batch, dim).
+        """
+        mask = attention_mask.unsqueeze(-1).to(hidden_state.dtype)
+        return (hidden_state * mask).sum(1) / mask.sum(1).clamp(min=1e-4)
+
+    def _capture_query_graph(self):
+        """
+        Captures a CUDA graph of the forward pass for a single query padded to QUERY_MAX_LENGTH tokens.
+        """
+        self._static_input_ids = torch.zeros(1, QUERY_MAX_LENGTH, dtype=torch.long, device=self.device)
+        self._static_attention_mask = torch.ones(1, QUERY_MAX_LENGTH, dtype=torch.long, device=self.device)
+
+        # Warm up on a side stream before capturing, as required for CUDA graph capture
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.no_grad(), torch.cuda.stream(stream):
+            for _ in range(3):
+                self.model(input_ids=self._static_input_ids, attention_mask=self._static_attention_mask)
+        torch.cuda.current_stream().wait_stream(stream)
+
+        self._query_graph = torch.cuda.CUDAGraph()
+        with torch.no_grad(), torch.cuda.graph(self._query_graph):
+            model_output = self.model(input_ids=self._static_input_ids, attention_mask=self._static_attention_mask)
+            self._static_query_embedding = self.mean_pool(model_output.last_hidden_state, self._static_attention_mask)
+
+    @torch.inference_mode()
+    def encode_query(self, query: str) -> torch.Tensor:
+        """
+        Encodes a single query. On CUDA the query is padded to QUERY_MAX_LENGTH tokens and the captured graph is replayed.
+
+        :param query: The query text.
+        :return: Embedding of the query.
+        """
+        if self._query_graph is None:
+            return self.encode_texts([query])[0]
+
+        encoded_input = self.tokenizer(query, **self._tok_kwargs)
+        for name, buf in self._query_bufs.items():
+            buf.copy_(encoded_input[name])
+        self._static_input_ids.copy_(self._query_bufs['input_ids'], non_blocking=True)
+        self._static_attention_mask.copy_(self._query_bufs['attention_mask'], non_blocking=True)
+        self._query_graph.replay()
+        return self._static_query_embedding[0].clone()
+
+    def query_cache_header(self) -> Dict[str, object]:
+        """
+        Describes how query embeddings are computed; a persisted cache is only reused if its header matches.
+
+        :return: The cache format version, model name, inference backend and query token limit.
+        """
+        return {
+            'version': QUERY_CACHE_VERSION,
+            'model_name': self.model_name,
+            'backend': self.backend,
+            'max_length': QUERY_MAX_LENGTH if self._query_graph is not None else TEXT_MAX_LENGTH,
+        }
+
+    def load_query_cache(self) -> "OrderedDict[str, np.ndarray]":
+        """
+        Loads query embeddings persisted by a previous session that computed them the same way.
+        A missing, unreadable or mismatching cache file is treated as an empty cache.
+
+        :return: An ordered dictionary mapping normalized queries to their embeddings, least recently used first.
+        """
+        try:
+            with open(self.query_cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return OrderedDict()
+        if not isinstance(cached, dict) or cached.get('header') != self.query_cache_header():
+            return OrderedDict()
+        embeddings = list(cached['embeddings'].items())[-QUERY_CACHE_SIZE:]
+        return OrderedDict((query, np.asarray(embedding, dtype=np.float16)) for query, embedding in embeddings)
+
+    def save_query_cache(self):
+        """
+        Persists the query embeddings computed so far to the query cache file.
+        The file is written to a temporary path and then renamed, so an interrupted save leaves the old cache intact.
+        """
+        os.makedirs(os.path.dirname(self.query_cache_path), exist_ok=True)
+        tmp_path = self.query_cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'header': self.query_cache_header(), 'embeddings': self._query_embeddings}, f)
+        os.replace(tmp_path, self.query_cache_path)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        Normalizes a query so that trivially different spellings share a cache entry.
+
+        :param query: The query text.
+        :return: The lowercased query with collapsed whitespace.
+        """
+        return " ".join(query.lower().split())
+
+    def _embed_query(self, norm_query: str) -> np.ndarray:
+        """
+        Encodes a normalized query into an L2-normalized fp16 embedding, reusing cached results.
+
+        :param norm_query: The normalized query text.
+        :return: Embedding of the query.
+        """
+        if norm_query in self._query_embeddings:
+            self._query_embeddings.move_to_end(norm_query)
+        else:
+            query_embedding = self.encode_query(norm_query)
+            query_embedding = torch.nn.functional.normalize(query_embedding, dim=0)
+            self._query_embeddings[norm_query] = query_embedding.cpu().numpy().astype(np.float16)
+            if len(self._query_embeddings) > QUERY_CACHE_SIZE:
+                self._query_embeddings.popitem(last=False)
+        return self._query_embeddings[norm_query]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Encodes a query into an L2-normalized embedding.
+
+        :param query: The query text.
+        :return: Embedding of the query.
+        """
+        return self._embed_query(self.normalize_query(query))
 
     def compute_similarity(self, query: str) -> List[str]:
         """
@@ -61,9 +264,14 @@ class SummaryMatcher:
         :param query: The query text.
         :return: Names of the top k matching documents.
         """
-        query_embedding = self.encode_texts([query])
-        cos_sims = torch.nn.functional.cosine_similarity(query_embedding, self.embeddings)
-        top_matches_indices = cos_sims.topk(self.k).indices
+        query_embedding = self.embed_query(query)
+        cos_sims = self.embeddings_np @ query_embedding
+        # Select the top k in O(N), then sort only those k
+        if self.k < len(cos_sims):
+            top_matches_indices = np.argpartition(-cos_sims, self.k)[:self.k]
+        else:
+            top_matches_indices = np.arange(len(cos_sims))
+        top_matches_indices = top_matches_indices[np.argsort(-cos_sims[top_matches_indices])]
         return [self.doc_names[i] for i in top_matches_indices]
 
 
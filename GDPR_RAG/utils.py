@@ -1,40 +1,52 @@
 import os
-import io
-import sys
+import re
+import json
+import functools
+import contextlib
 import warnings
+from collections import defaultdict
+from itertools import chain
 from dotenv import load_dotenv, find_dotenv
 from typing import Dict, List
 
-from llama_index.core import ServiceContext, VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.core.node_parser import HierarchicalNodeParser, get_leaf_nodes
+from llama_index.core import ServiceContext, VectorStoreIndex, load_index_from_storage
+from llama_index.core.embeddings import resolve_embed_model
+from llama_index.core.node_parser import get_leaf_nodes
 from llama_index.core.indices.postprocessor import SentenceTransformerRerank
 from llama_index.core.retrievers import AutoMergingRetriever
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.vector_stores import MetadataFilter
 
+from embedding_cache import CachedEmbedding
+from orjson_storage import orjson_storage_context
+from node_parsing import parse_documents_parallel
+
+from optimum.bettertransformer import BetterTransformer
+
 from trulens_eval import Feedback, TruLlama, OpenAI
 from trulens_eval.feedback import Groundedness
 
 import numpy as np
-import configparser
+import torch
+from config import load_config
 
 warnings.filterwarnings("ignore")
 
-# Load settings from config file
-config = configparser.ConfigParser()
-config.read('config.ini')
+# Settings parsed once from the config file
+CFG = load_config()
+
+ARTICLE_INDEX_FILE = "article_index.json"
 
-# Global settings from config file
-RERANK_MODEL = config['Settings']['RERANK_MODEL']
-SIMILARITY_TOP_K = config.getint('Settings', 'SIMILARITY_TOP_K')
-RERANK_TOP_N = config.getint('Settings', 'RERANK_TOP_N')
-EMBED_MODEL = config['Settings']['EMBED_MODEL']
-INDEX_DIR = config['Settings']['INDEX_DIR']
+# Matches metadata lines such as '1. **Article 1 - Title**: Summary', capturing the title and the summary
+SUMMARY_LINE_RE = re.compile(r'\*\*([^*]+)\*\*[^:\n]*:([^\n]*?)\s*$', re.MULTILINE)
+
+# Sink for output suppressed by suppress_print, opened once for the lifetime of the process
+_DEVNULL = open(os.devnull, 'w')
 
 
 def suppress_print(func):
     """
-    Decorator to suppress printing to the console within a function.
+    Decorator to suppress printing to the console (stdout and stderr) within a function.
     
     Args:
         func: The function to wrap.
@@ -42,17 +54,11 @@ def suppress_print(func):
     Returns:
         Wrapped function that suppresses print statements.
     """
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        # Redirect stdout to an in-memory stream
-        original_stdout = sys.stdout
-        sys.stdout = io.StringIO()
-        try:
-            # Execute the function with printing suppressed
-            result = func(*args, **kwargs)
-        finally:
-            # Restore the original stdout
-            sys.stdout = original_stdout
-        return result
+        # Discard stdout and stderr through a single shared handle to os.devnull
+        with contextlib.redirect_stdout(_DEVNULL), contextlib.redirect_stderr(_DEVNULL):
+            return func(*args, **kwargs)
     return wrapper
 
 
@@ -67,13 +73,9 @@ def load_article_summaries(meta_file_path: str) -> Dict[str, str]:
     Returns:
         A dictionary mapping article identifiers to summaries.
     """
-    article_summaries = {}
     with open(meta_file_path, 'r') as f:
-        for line in f:
-            if line.strip():
-                key, value = line.strip().split(':', 1)
-                article_summaries[key.split('**', 2)[1]] = value
-    return article_summaries
+        text = f.read()
+    return {m.group(1): m.group(2) for m in SUMMARY_LINE_RE.finditer(text)}
 
 def get_openai_api_key() -> str:
     """
@@ -86,7 +88,8 @@ def get_openai_api_key() -> str:
     return os.getenv("OPENAI_API_KEY")
 
 def build_automerging_index(documents: List[Dict], llm: OpenAI, embed_model: str = "local:BAAI/bge-small-en-v1.5", 
-                            save_dir: str = "merging_index", chunk_sizes: List[int] = None) -> VectorStoreIndex:
+                            save_dir: str = "merging_index", chunk_sizes: List[int] = None,
+                            embed_batch_size: int = 64, embed_cache_path: str = "embed_cache.sqlite") -> VectorStoreIndex:
     """
     Builds or loads an automerging index for the provided documents.
 
@@ -96,29 +99,81 @@ def build_automerging_index(documents: List[Dict], llm: OpenAI, embed_model: str
         embed_model: The embedding model identifier.
         save_dir: The directory where the index should be saved or loaded from.
         chunk_sizes: A list defining chunk sizes for hierarchical parsing.
+        embed_batch_size: The number of nodes embedded per embedding call.
+        embed_cache_path: The SQLite file where node embeddings are cached across builds.
 
     Returns:
         An automerging index.
     """
     chunk_sizes = chunk_sizes or [2048, 512, 128]
-    node_parser = HierarchicalNodeParser.from_defaults(chunk_sizes=chunk_sizes)
-    nodes = node_parser.get_nodes_from_documents(documents)
+    nodes = parse_documents_parallel(documents, chunk_sizes)
     leaf_nodes = get_leaf_nodes(nodes)
-    
+
+    # Embed leaf nodes in batches rather than one request per node, reusing embeddings of unchanged chunks
+    # The wrapper forwards cache misses to the inner model, which splits them by its own batch size
+    embed_model = resolve_embed_model(embed_model)
+    embed_model.embed_batch_size = embed_batch_size
+    embed_model = CachedEmbedding(embed_model, cache_path=embed_cache_path)
     merging_context = ServiceContext.from_defaults(llm=llm, embed_model=embed_model)
-    storage_context = StorageContext.from_defaults()
+    storage_context = orjson_storage_context()
     
     storage_context.docstore.add_documents(nodes)
 
     if not os.path.exists(save_dir):
         automerging_index = VectorStoreIndex(leaf_nodes, storage_context=storage_context, service_context=merging_context)
         automerging_index.storage_context.persist(persist_dir=save_dir)
+        save_article_index(build_article_index(automerging_index), save_dir)
     else:
-        automerging_index = load_index_from_storage(StorageContext.from_defaults(persist_dir=save_dir), service_context=merging_context)
+        automerging_index = load_index_from_storage(orjson_storage_context(save_dir), service_context=merging_context)
 
     return automerging_index
 
-def load_automerging_index(llm: OpenAI = None, embed_model: str = EMBED_MODEL, save_dir: str = "merging_index") -> VectorStoreIndex:
+def build_article_index(automerging_index: VectorStoreIndex) -> Dict[str, List[str]]:
+    """
+    Builds an inverted index from article number to the ids of the nodes belonging to that article.
+
+    Parameters:
+        automerging_index: The automerging index whose docstore is scanned.
+
+    Returns:
+        A dictionary mapping article numbers to node ids.
+    """
+    article_to_node_ids = defaultdict(list)
+    for node in automerging_index.docstore.docs.values():
+        article_to_node_ids[node.metadata.get('article_number')].append(node.node_id)
+    return dict(article_to_node_ids)
+
+def save_article_index(article_to_node_ids: Dict[str, List[str]], save_dir: str):
+    """
+    Persists the article inverted index alongside the automerging index.
+
+    Parameters:
+        article_to_node_ids: A dictionary mapping article numbers to node ids.
+        save_dir: The directory where the index is saved.
+    """
+    with open(os.path.join(save_dir, ARTICLE_INDEX_FILE), 'w') as f:
+        json.dump(article_to_node_ids, f)
+
+def load_article_index(automerging_index: VectorStoreIndex, save_dir: str = "merging_index") -> Dict[str, List[str]]:
+    """
+    Loads the article inverted index persisted alongside an automerging index, building and saving it if missing.
+
+    Parameters:
+        automerging_index: The automerging index the inverted index belongs to.
+        save_dir: The directory where the index is saved.
+
+    Returns:
+        A dictionary mapping article numbers to node ids.
+    """
+    article_index_path = os.path.join(save_dir, ARTICLE_INDEX_FILE)
+    if os.path.exists(article_index_path):
+        with open(article_index_path, 'r') as f:
+            return json.load(f)
+    article_to_node_ids = build_article_index(automerging_index)
+    save_article_index(article_to_node_ids, save_dir)
+    return article_to_node_ids
+
+def load_automerging_index(llm: OpenAI = None, embed_model: str = CFG.embed_model, save_dir: str = "merging_index") -> VectorStoreIndex:
     """
     Loads an existing automerging index from storage.
 
@@ -131,10 +186,44 @@ def load_automerging_index(llm: OpenAI = None, embed_model: str = EMBED_MODEL, s
         An automerging index.
     """
     merging_context = ServiceContext.from_defaults(llm=llm, embed_model=embed_model)
-    return load_index_from_storage(StorageContext.from_defaults(persist_dir=save_dir), service_context=merging_context)
+    return load_index_from_storage(orjson_storage_context(save_dir), service_context=merging_context)
+
+@functools.lru_cache(maxsize=None)
+def _load_rerank_model(model: str) -> SentenceTransformerRerank:
+    """
+    Loads the reranking model; cached on the model identifier only so the weights are loaded once.
+    The cross-encoder is int8 dynamically quantized on CPU and converted to BetterTransformer on CUDA.
+    """
+    rerank = SentenceTransformerRerank(model=model)
+    cross_encoder = rerank._model
+    # BetterTransformer fuses the Linear layers that dynamic quantization targets, so only one of them can apply.
+    # Its fused kernels exist for CPU and CUDA only, so models on other devices (e.g. MPS) are left as loaded.
+    # CrossEncoder only moves the model to its target device on predict(), so the weights are still on CPU here
+    device_type = cross_encoder._target_device.type
+    if device_type == 'cpu':
+        cross_encoder.model = torch.quantization.quantize_dynamic(cross_encoder.model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif device_type == 'cuda':
+        cross_encoder.model = BetterTransformer.transform(cross_encoder.model)
+    return rerank
+
+def get_rerank_model(top_n: int = CFG.rerank_top_n, model: str = CFG.rerank_model) -> SentenceTransformerRerank:
+    """
+    Returns the shared reranking model instance, loading it on first use.
+
+    Parameters:
+        top_n: The number of top results to keep after reranking.
+        model: The reranking model identifier.
 
-def get_automerging_query_engine(automerging_index: VectorStoreIndex, relevant_articles: List[str], similarity_top_k: int = SIMILARITY_TOP_K, 
-                                 rerank_top_n: int = RERANK_TOP_N) -> RetrieverQueryEngine:
+    Returns:
+        A reranking node postprocessor.
+    """
+    rerank = _load_rerank_model(model)
+    rerank.top_n = top_n
+    return rerank
+
+def get_automerging_query_engine(automerging_index: VectorStoreIndex, relevant_articles: List[str], similarity_top_k: int = CFG.similarity_top_k, 
+                                 rerank_top_n: int = CFG.rerank_top_n,
+                                 article_to_node_ids: Dict[str, List[str]] = None) -> RetrieverQueryEngine:
     """
     Configures and returns a query engine for an automerging index.
 
@@ -143,20 +232,24 @@ def get_automerging_query_engine(automerging_index: VectorStoreIndex, relevant_a
         relevant_articles: A list of titles of relevant articles to filter by.
         similarity_top_k: The number of top similar results to retrieve.
         rerank_top_n: The number of top results to rerank.
+        article_to_node_ids: The article inverted index from load_article_index; built from the docstore if None.
 
     Returns:
         A configured query engine.
     """
 
     #Filter based on metadata
-    node_ids = [n.node_id for n in automerging_index.docstore.docs.values() if n.metadata['article_number'] in relevant_articles]
+    if article_to_node_ids is None:
+        article_to_node_ids = build_article_index(automerging_index)
+    node_ids = list(chain.from_iterable(article_to_node_ids.get(a, ()) for a in set(relevant_articles)))
 
-    base_retriever = automerging_index.as_retriever(similarity_top_k=similarity_top_k)
+    # The vector store only searches the given node ids; an empty filter would return nothing, so search everything then
+    base_retriever = automerging_index.as_retriever(similarity_top_k=similarity_top_k, node_ids=node_ids or None)
     retriever = AutoMergingRetriever(base_retriever, automerging_index.storage_context, verbose=True)
 
-    rerank = SentenceTransformerRerank(top_n=rerank_top_n, model=RERANK_MODEL)
+    rerank = get_rerank_model(top_n=rerank_top_n)
     
-    auto_merging_engine = RetrieverQueryEngine.from_args(retriever, node_ids=node_ids, node_postprocessors=[rerank])
+    auto_merging_engine = RetrieverQueryEngine.from_args(retriever, node_postprocessors=[rerank])
 
     return auto_merging_engine
 
@@ -222,6 +315,7 @@ def get_prebuilt_trulens_recorder(query_engine, app_id: str) -> TruLlama:
 
 
 
+
 if __name__ == "__main__":
 
     pass
\ No newline at end of file